@@ -1,25 +1,41 @@
+import collections
+import itertools
 import os
 import logging
-from typing import List, Dict, Any, Optional
+import requests
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Any, Iterator, Optional
 from apify_client import ApifyClient
 
+try:
+    import ijson
+except ImportError:
+    ijson = None
+
 class ApifyExtractor:
     """
     Extrator que executa um Actor Apify (passado por actor_id) e retorna os itens do dataset do run.
     Usa APIFY_TOKEN via variável de ambiente.
     """
+
+    API_BASE_URL = "https://api.apify.com/v2"
+    PAGE_SIZE = 1000  # Itens por página ao baixar o dataset em paralelo
+    MAX_DOWNLOAD_WORKERS = 8
+
     def __init__(self, actor_id: str = "q0PB9Xd1hjynYAEhi", apify_token: Optional[str] = None, domain_code: str = "AR"):
         self.logger = logging.getLogger(__name__)
         token = apify_token or os.getenv("APIFY_TOKEN")
         if not token:
             raise ValueError("APIFY_TOKEN não encontrado nas variáveis de ambiente")
+        self._token = token
         self.client = ApifyClient(token)
         self.actor_id = actor_id
         self.domain_code = domain_code
 
-    def run_search(self, search: str, search_category: str = "all", sort_by: str = "relevance", fast_mode: bool = False, use_proxy: bool = True) -> List[Dict[str, Any]]:
+    def run_search(self, search: str, search_category: str = "all", sort_by: str = "relevance", fast_mode: bool = False, use_proxy: bool = True) -> Iterator[Dict[str, Any]]:
         """
-        Executa o actor do Apify com os inputs necessários e retorna a lista de itens (dicionários).
+        Executa o actor do Apify com os inputs necessários e gera os itens (dicionários)
+        um a um, sem materializar o dataset inteiro em memória.
         """
         run_input = {
             "debugMode": False,
@@ -48,15 +64,52 @@ class ApifyExtractor:
             return []
 
         self.logger.info(f"Recuperando resultados do dataset {dataset_id}")
-        items = []
         try:
-            # iterate_items retorna gerador
-            for item in self.client.dataset(dataset_id).iterate_items():
-                # O item já deve ser um dict no formato que você descreveu; só append
-                items.append(item)
+            yield from self._iter_dataset_items(dataset_id)
         except Exception as e:
             self.logger.error(f"Erro ao iterar items do dataset {dataset_id}: {e}")
             raise
 
-        self.logger.info(f"Total de itens obtidos do Apify: {len(items)}")
-        return items
\ No newline at end of file
+    def _iter_dataset_items(self, dataset_id: str) -> Iterator[Dict[str, Any]]:
+        """
+        Gera os itens do dataset um a um. Com ijson disponível, faz o parse
+        incremental direto do corpo HTTP (pico de memória de um registro);
+        senão, cai no gerador paginado do apify_client.
+        """
+        dataset = self.client.dataset(dataset_id)
+
+        # Dataset grande: o endpoint de itens aceita offset/limit, então as
+        # páginas podem ser baixadas em paralelo em vez de uma única conexão
+        # serial. A janela de futures é limitada a MAX_DOWNLOAD_WORKERS: o
+        # download só se adianta essa quantidade de páginas do consumidor,
+        # mantendo o pico de memória na janela e não no dataset inteiro
+        total = (dataset.get() or {}).get('itemCount', 0)
+        if total > self.PAGE_SIZE:
+            offsets = iter(range(0, total, self.PAGE_SIZE))
+
+            def fetch_page(offset: int):
+                return dataset.list_items(offset=offset, limit=self.PAGE_SIZE).items
+
+            with ThreadPoolExecutor(max_workers=self.MAX_DOWNLOAD_WORKERS) as executor:
+                pending = collections.deque(
+                    executor.submit(fetch_page, offset)
+                    for offset in itertools.islice(offsets, self.MAX_DOWNLOAD_WORKERS)
+                )
+                while pending:
+                    page = pending.popleft().result()
+                    for offset in itertools.islice(offsets, 1):
+                        pending.append(executor.submit(fetch_page, offset))
+                    yield from page
+            return
+
+        if ijson is None:
+            # iterate_items retorna gerador; repassa direto para o consumidor
+            yield from dataset.iterate_items()
+            return
+
+        url = f"{self.API_BASE_URL}/datasets/{dataset_id}/items"
+        params = {'format': 'json', 'clean': 'true', 'token': self._token}
+        with requests.get(url, params=params, stream=True, timeout=300) as response:
+            response.raise_for_status()
+            response.raw.decode_content = True
+            yield from ijson.items(response.raw, 'item')
\ No newline at end of file
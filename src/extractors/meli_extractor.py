@@ -1,143 +1,229 @@
+import itertools
+import operator
+import orjson
 import requests
 import logging
 import time
-from typing import List, Dict, Optional
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from typing import Iterable, Iterator, List, Dict, Optional
 from datetime import datetime
 
+
+# Sentinela compartilhada para misses de dicts aninhados: evita alocar um
+# dict vazio novo a cada produto sem o campo (nunca é mutada)
+_EMPTY: Dict = {}
+
+
+# Campos copiados 1:1 do resultado da busca; itemgetter resolve todos em uma
+# única chamada C em vez de um PyDict_GetItem por campo no loop quente
+_BASIC_KEYS = ('id', 'title', 'price', 'currency_id', 'condition',
+               'thumbnail', 'permalink', 'category_id')
+_basic_getter = operator.itemgetter(*_BASIC_KEYS)
+
+
+# Memoização em nível de módulo (lru_cache em método ligado reteria self):
+# o mesmo vendedor/produto se repete entre páginas e entre buscas no mesmo
+# processo, então cada id só gera uma chamada HTTP
+@lru_cache(maxsize=4096)
+def _fetch_product_details(session: requests.Session, base_url: str, product_id: str) -> Dict:
+    response = session.get(f"{base_url}/items/{product_id}", timeout=30)
+    response.raise_for_status()
+    # orjson decodifica em C, ~3-5x mais rápido que o response.json() padrão
+    return orjson.loads(response.content)
+
+
+@lru_cache(maxsize=4096)
+def _fetch_seller_info(session: requests.Session, base_url: str, seller_id: int) -> Dict:
+    response = session.get(f"{base_url}/users/{seller_id}", timeout=30)
+    response.raise_for_status()
+    return orjson.loads(response.content)
+
+
 class MeliExtractor:
     """Extrator de dados da API do Mercado Libre."""
-    
+
     BASE_URL = "https://api.mercadolibre.com"
-    
+    MAX_PRODUCTS = 200  # Limite máximo de produtos por busca
+
     def __init__(self, site_id: str = "MLA"):
         """
         Inicializa o extrator.
-        
+
         Args:
             site_id: Código do site (MLA para Argentina)
         """
         self.site_id = site_id
         self.session = requests.Session()
+        # Pool de conexões keep-alive: evita refazer TCP+TLS a cada chamada
+        # de detalhe/vendedor, com retry/backoff para 429 e 5xx
+        adapter = HTTPAdapter(
+            pool_connections=1,
+            pool_maxsize=32,
+            max_retries=Retry(
+                total=5,
+                backoff_factor=0.3,
+                status_forcelist=(429, 500, 502, 503, 504),
+                allowed_methods=("GET",)
+            )
+        )
+        self.session.mount("https://", adapter)
+        self.session.headers.update({
+            "User-Agent": "meli-etl/1.0",
+            "Accept-Encoding": "gzip"
+        })
         self.logger = logging.getLogger(__name__)
         
-    def search_products(self, query: str, limit: int = 50) -> List[Dict]:
+    def search_products(self, query: str, limit: int = 50) -> Iterator[Dict]:
         """
         Busca produtos na API do Mercado Libre.
-        
+
         Args:
             query: Termo de busca
             limit: Limite de resultados por página
-            
-        Returns:
-            Lista de produtos encontrados
+
+        Yields:
+            Produtos enriquecidos, um a um, para consumo em streaming
         """
-        products = []
-        offset = 0
-        
         try:
-            while len(products) < 200:  # Limite máximo de produtos
-                url = f"{self.BASE_URL}/sites/{self.site_id}/search"
-                params = {
-                    'q': query,
-                    'limit': limit,
-                    'offset': offset
-                }
-                
-                response = self.session.get(url, params=params, timeout=30)
-                response.raise_for_status()
-                
-                data = response.json()
-                results = data.get('results', [])
-                
-                if not results:
-                    break
-                    
-                # Enriquecer dados com informações detalhadas
-                enriched_products = self._enrich_products(results)
-                products.extend(enriched_products)
-                
-                offset += limit
-                
-                # Rate limiting
-                time.sleep(0.5)
-                
+            # Os offsets são conhecidos de antemão (0, limit, ... < MAX_PRODUCTS),
+            # então todas as páginas podem ser buscadas em paralelo em vez de
+            # pagar uma RTT por página em sequência
+            offsets = range(0, self.MAX_PRODUCTS, limit)
+            with ThreadPoolExecutor(max_workers=8) as executor:
+                pages = list(executor.map(
+                    lambda offset: self._fetch_page(query, limit, offset),
+                    offsets
+                ))
         except requests.exceptions.RequestException as e:
             self.logger.error(f"Erro na busca de produtos: {e}")
             raise
-            
-        return products
-    
-    def _enrich_products(self, products: List[Dict]) -> List[Dict]:
+
+        results = itertools.chain.from_iterable(pages)
+
+        # Enriquecer dados com informações detalhadas
+        yield from self._enrich_products(itertools.islice(results, self.MAX_PRODUCTS))
+
+    def _fetch_page(self, query: str, limit: int, offset: int) -> List[Dict]:
+        """Busca uma página de resultados da API de search."""
+        url = f"{self.BASE_URL}/sites/{self.site_id}/search"
+        params = {
+            'q': query,
+            'limit': limit,
+            'offset': offset
+        }
+
+        response = self.session.get(url, params=params, timeout=30)
+        response.raise_for_status()
+        self._respect_rate_limit(response)
+
+        data = orjson.loads(response.content)
+        return data.get('results', [])
+
+    def _respect_rate_limit(self, response: requests.Response) -> None:
+        """
+        Rate limiting dirigido pelos headers da resposta: só dorme quando o
+        servidor sinaliza que a cota acabou, em vez de um sleep fixo por página.
+        """
+        try:
+            remaining = int(response.headers.get('X-RateLimit-Remaining', '1'))
+            retry_after = float(response.headers.get('Retry-After', '0'))
+        except (TypeError, ValueError):
+            return
+
+        if remaining <= 0 and retry_after > 0:
+            self.logger.info(f"Cota da API esgotada; aguardando {retry_after}s")
+            time.sleep(retry_after)
+
+
+    def _enrich_products(self, products: Iterable[Dict], extraction_ts: Optional[str] = None) -> Iterator[Dict]:
         """
         Enriquece os dados dos produtos com informações detalhadas.
-        
+
         Args:
-            products: Lista de produtos básicos
-            
-        Returns:
-            Lista de produtos enriquecidos
+            products: Produtos básicos retornados pela busca
+            extraction_ts: Timestamp ISO pré-formatado do lote; se None,
+                é calculado uma única vez na entrada
+
+        Yields:
+            Produtos enriquecidos, um a um
         """
-        enriched = []
-        
-        for product in products:
-            try:
-                # Obter detalhes do produto
-                details = self._get_product_details(product['id'])
-                
-                # Obter informações do vendedor
-                seller_info = self._get_seller_info(product.get('seller', {}).get('id'))
-                
-                # Combinar informações
-                enriched_product = {
-                    'id': product['id'],
-                    'title': product['title'],
-                    'price': product['price'],
-                    'currency_id': product['currency_id'],
-                    'condition': product['condition'],
-                    'thumbnail': product['thumbnail'],
-                    'permalink': product['permalink'],
-                    'category_id': product['category_id'],
-                    'seller_id': product.get('seller', {}).get('id'),
-                    'seller_nickname': product.get('seller', {}).get('nickname'),
-                    'address': product.get('address', {}),
-                    'attributes': details.get('attributes', []),
-                    'pictures': details.get('pictures', []),
-                    'warranty': details.get('warranty'),
-                    'seller_info': seller_info,
-                    'extraction_date': datetime.utcnow().isoformat()
-                }
-                
-                enriched.append(enriched_product)
-                
-            except Exception as e:
-                self.logger.warning(f"Erro ao enriquecer produto {product['id']}: {e}")
-                # Adicionar produto básico mesmo com erro
-                product['extraction_date'] = datetime.utcnow().isoformat()
-                enriched.append(product)
-                
-        return enriched
+        # Um único timestamp por lote em vez de um utcnow()+isoformat() por linha
+        if extraction_ts is None:
+            extraction_ts = datetime.utcnow().isoformat()
+
+        products = list(products)
+
+        # O mesmo vendedor se repete muitas vezes na mesma página; deduplica
+        # os ids antes de ir à rede para buscar cada um uma única vez
+        unique_sellers = {
+            seller_id
+            for p in products
+            if (seller_id := (p.get('seller') or _EMPTY).get('id'))
+        }
+
+        # As chamadas são I/O puro; dispara tudo em paralelo compartilhando
+        # o pool keep-alive da session (pool_maxsize=32)
+        with ThreadPoolExecutor(max_workers=16) as executor:
+            seller_futures = {
+                seller_id: executor.submit(self._get_seller_info, seller_id)
+                for seller_id in unique_sellers
+            }
+            pending = [
+                (product, executor.submit(self._get_product_details, product['id']))
+                for product in products
+            ]
+
+            for product, fut_details in pending:
+                try:
+                    details = fut_details.result()
+
+                    # Lê o dict aninhado de vendedor uma única vez por linha
+                    seller = product.get('seller') or _EMPTY
+                    fut_seller = seller_futures.get(seller.get('id'))
+                    seller_info = fut_seller.result() if fut_seller is not None else {}
+
+                    # Combinar informações
+                    enriched_product = dict(zip(_BASIC_KEYS, _basic_getter(product)))
+
+                    enriched_product.update({
+                        'seller_id': seller.get('id'),
+                        'seller_nickname': seller.get('nickname'),
+                        # Dict novo no miss: a linha emitida pode ser mutada
+                        # adiante, então a sentinela não pode escapar para cá
+                        'address': product.get('address', {}),
+                        'attributes': details.get('attributes', []),
+                        'pictures': details.get('pictures', []),
+                        'warranty': details.get('warranty'),
+                        'seller_info': seller_info,
+                        'extraction_date': extraction_ts
+                    })
+
+                    yield enriched_product
+
+                except Exception as e:
+                    self.logger.warning(f"Erro ao enriquecer produto {product['id']}: {e}")
+                    # Adicionar produto básico mesmo com erro
+                    product['extraction_date'] = extraction_ts
+                    yield product
     
     def _get_product_details(self, product_id: str) -> Dict:
-        """Obtém detalhes específicos do produto."""
+        """Obtém detalhes específicos do produto (memoizado por id)."""
         try:
-            url = f"{self.BASE_URL}/items/{product_id}"
-            response = self.session.get(url, timeout=30)
-            response.raise_for_status()
-            return response.json()
+            return _fetch_product_details(self.session, self.BASE_URL, product_id)
         except Exception as e:
             self.logger.warning(f"Erro ao obter detalhes do produto {product_id}: {e}")
             return {}
-    
+
     def _get_seller_info(self, seller_id: Optional[int]) -> Dict:
-        """Obtém informações do vendedor."""
+        """Obtém informações do vendedor (memoizado por id)."""
         if not seller_id:
             return {}
-            
+
         try:
-            url = f"{self.BASE_URL}/users/{seller_id}"
-            response = self.session.get(url, timeout=30)
-            response.raise_for_status()
-            return response.json()
+            return _fetch_seller_info(self.session, self.BASE_URL, seller_id)
         except Exception as e:
             self.logger.warning(f"Erro ao obter info do vendedor {seller_id}: {e}")
             return {}
\ No newline at end of file
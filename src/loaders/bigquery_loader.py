@@ -1,17 +1,97 @@
+import collections
+import io
+import itertools
 import logging
-from typing import List, Dict, Any
+from typing import Dict, Any, Iterable
+import orjson
 from google.cloud import bigquery
 from google.cloud.exceptions import NotFound
-from datetime import datetime, date, time
 import decimal
 
+
+def _decimal_to_float(obj: decimal.Decimal) -> Any:
+    # converter Decimal para float pode perder precisão, ajustar se precisar
+    try:
+        return float(obj)
+    except Exception:
+        return str(obj)
+
+
+def _bytes_to_str(obj: Any) -> str:
+    try:
+        return obj.decode("utf-8")
+    except Exception:
+        return str(obj)
+
+
+# Despacho por type() exato: um lookup O(1) em dict C em vez de uma cascata
+# de isinstance por valor exótico
+_JSON_HANDLERS = {
+    decimal.Decimal: _decimal_to_float,
+    bytes: _bytes_to_str,
+    bytearray: _bytes_to_str,
+    tuple: list,
+    set: list,
+    frozenset: list,
+}
+
+
+def _json_default(obj: Any) -> Any:
+    """Fallback do orjson para tipos fora do conjunto serializável nativo."""
+    handler = _JSON_HANDLERS.get(type(obj))
+    if handler is not None:
+        return handler(obj)
+
+    # Subclasses não casam no type() exato; resolve por isinstance
+    for base, base_handler in _JSON_HANDLERS.items():
+        if isinstance(obj, base):
+            return base_handler(obj)
+
+    # Fallback: string representation
+    return str(obj)
+
+
+# Schema alinhado ao output do Apify; construído uma única vez no import em
+# vez de realocar os SchemaField a cada load/create
+_SCHEMA = (
+    bigquery.SchemaField("product_id", "STRING", mode="REQUIRED"),
+    bigquery.SchemaField("title", "STRING", mode="NULLABLE"),
+    bigquery.SchemaField("subtitle", "STRING", mode="NULLABLE"),
+    bigquery.SchemaField("originalPrice", "STRING", mode="NULLABLE"),
+    bigquery.SchemaField("price", "FLOAT", mode="NULLABLE"),
+    bigquery.SchemaField("price_string", "STRING", mode="NULLABLE"),
+    bigquery.SchemaField("alternativePrice", "STRING", mode="NULLABLE"),
+    bigquery.SchemaField("rating", "FLOAT", mode="NULLABLE"),
+    bigquery.SchemaField("reviews", "INT64", mode="NULLABLE"),
+    bigquery.SchemaField("condition", "STRING", mode="NULLABLE"),
+    bigquery.SchemaField("seller", "STRING", mode="NULLABLE"),
+    bigquery.SchemaField("description", "STRING", mode="NULLABLE"),
+    bigquery.SchemaField("images", "STRING", mode="REPEATED"),
+    bigquery.SchemaField("sellCount", "INT64", mode="NULLABLE"),
+    bigquery.SchemaField("url", "STRING", mode="NULLABLE"),
+    bigquery.SchemaField("currency", "STRING", mode="NULLABLE"),
+    bigquery.SchemaField("extraction_date", "TIMESTAMP", mode="REQUIRED"),
+    bigquery.SchemaField("JOB_RUN", "TIMESTAMP", mode="REQUIRED"),
+)
+
 class BigQueryLoader:
     """Carregador de dados para o BigQuery (schema atualizado para o output do Apify)."""
 
-    def __init__(self, project_id: str, dataset_id: str, table_id: str):
+    BATCH_SIZE = 5000  # Linhas por load job; limita o pico de memória
+    MAX_INFLIGHT_JOBS = 4  # Load jobs submetidos sem esperar o resultado
+    STREAM_BATCH_SIZE = 500  # Linhas por requisição de streaming insert
+
+    def __init__(self, project_id: str, dataset_id: str, table_id: str, streaming: bool = False):
+        """
+        Args:
+            streaming: se True, usa streaming inserts (insertAll) em vez de
+                load jobs — latência de append de ms em vez de segundos por
+                lote, ao custo da cobrança de streaming
+        """
         self.project_id = project_id
         self.dataset_id = dataset_id
         self.table_id = table_id
+        self.streaming = streaming
         self.client = bigquery.Client(project=project_id)
         self.logger = logging.getLogger(__name__)
 
@@ -33,13 +113,16 @@ class BigQueryLoader:
             table = self.client.create_table(table)
             self.logger.info(f"Tabela {self.table_id} criada com sucesso (particionada por JOB_RUN)")
 
-    def load_data(self, products: List[Dict[str, Any]]) -> int:
-        if not products:
-            self.logger.info("Nenhum produto para carregar")
-            return 0
+    def load_data(self, products: Iterable[Dict[str, Any]]) -> int:
+        """
+        Carrega produtos no BigQuery consumindo o iterável em lotes de
+        BATCH_SIZE, de forma que o pico de memória seja limitado pelo lote
+        e não pelo total de linhas.
+        """
+        products = iter(products)
 
-        # Serializar valores não-JSON-serializáveis (ex.: datetime)
-        json_rows = [self._serialize_item(p) for p in products]
+        if self.streaming:
+            return self._stream_rows(products)
 
         table_ref = self.client.dataset(self.dataset_id).table(self.table_id)
         job_config = bigquery.LoadJobConfig(
@@ -49,90 +132,84 @@ class BigQueryLoader:
             autodetect=False
         )
 
+        total_loaded = 0
+        pending_jobs = collections.deque()
         try:
-            job = self.client.load_table_from_json(json_rows, table_ref, job_config=job_config)
-            job.result()
-            self.logger.info(f"Carregados {len(products)} produtos no BigQuery")
-            return len(products)
+            while True:
+                batch = list(itertools.islice(products, self.BATCH_SIZE))
+                if not batch:
+                    break
+
+                # Serializar direto para NDJSON em bytes: orjson trata
+                # datetime/date/time nativamente (OPT_NAIVE_UTC marca os
+                # naive como UTC) e o load job ingere os bytes como estão
+                buffer = io.BytesIO()
+                for row in batch:
+                    buffer.write(orjson.dumps(row, default=_json_default, option=orjson.OPT_NAIVE_UTC))
+                    buffer.write(b"\n")
+
+                job = self.client.load_table_from_file(buffer, table_ref, job_config=job_config, rewind=True)
+                pending_jobs.append((job, len(batch)))
+
+                # Back-pressure: só espera o job mais antigo quando já há
+                # MAX_INFLIGHT_JOBS em voo, para sobrepor upload e ingestão
+                if len(pending_jobs) >= self.MAX_INFLIGHT_JOBS:
+                    oldest_job, batch_size = pending_jobs.popleft()
+                    oldest_job.result()
+                    total_loaded += batch_size
+                    self.logger.info(f"Carregados {total_loaded} produtos no BigQuery")
+
+            # Drena os jobs restantes
+            while pending_jobs:
+                job, batch_size = pending_jobs.popleft()
+                job.result()
+                total_loaded += batch_size
+                self.logger.info(f"Carregados {total_loaded} produtos no BigQuery")
         except Exception as e:
             self.logger.exception(f"Erro ao carregar no BigQuery: {e}")
             raise
 
-    def _serialize_item(self, item: Any) -> Any:
+        if total_loaded == 0:
+            self.logger.info("Nenhum produto para carregar")
+
+        return total_loaded
+
+    def _stream_rows(self, products: Iterable[Dict[str, Any]]) -> int:
         """
-        Converte recursivamente o item para tipos JSON serializáveis.
-        - datetime/date/time -> ISO 8601 string (Z se naive)
-        - decimal.Decimal -> float (ou string se preferir)
-        - bytes -> decode utf-8
-        - outros tipos compostos (list/dict/tuple) -> recursivo
+        Insere linhas via API de streaming (insertAll), que confirma cada
+        lote em milissegundos em vez de pagar o overhead de um load job.
         """
-        if item is None:
-            return None
-
-        # Primitivos seguros
-        if isinstance(item, (str, int, float, bool)):
-            return item
-
-        # datetime-like
-        if isinstance(item, datetime):
-            if item.tzinfo is None:
-                return item.isoformat() + "Z"
-            return item.isoformat()
-
-        if isinstance(item, date) and not isinstance(item, datetime):
-            # date -> iso date
-            return item.isoformat()
-
-        if isinstance(item, time):
-            return item.isoformat()
-
-        if isinstance(item, decimal.Decimal):
-            # converter Decimal para float pode perder precisão, ajustar se precisar
-            try:
-                return float(item)
-            except Exception:
-                return str(item)
-
-        # iteráveis
-        if isinstance(item, (list, tuple, set)):
-            return [self._serialize_item(v) for v in item]
-
-        if isinstance(item, dict):
-            out = {}
-            for k, v in item.items():
-                # BigQuery campo names devem ser strings; manter chaves como estão
-                out[k] = self._serialize_item(v)
-            return out
-
-        # bytes
-        if isinstance(item, (bytes, bytearray)):
-            try:
-                return item.decode("utf-8")
-            except Exception:
-                return str(item)
-
-        # Fallback: string representation
-        return str(item)
+        table_ref = self.client.dataset(self.dataset_id).table(self.table_id)
+
+        total_loaded = 0
+        try:
+            while True:
+                batch = list(itertools.islice(products, self.STREAM_BATCH_SIZE))
+                if not batch:
+                    break
+
+                # insertAll exige valores já JSON-serializáveis; reaproveita a
+                # serialização orjson do caminho de load job
+                json_rows = [
+                    orjson.loads(orjson.dumps(row, default=_json_default, option=orjson.OPT_NAIVE_UTC))
+                    for row in batch
+                ]
+
+                errors = self.client.insert_rows_json(table_ref, json_rows)
+                if errors:
+                    self.logger.error(f"Erros no streaming insert: {errors}")
+                    raise RuntimeError(f"Streaming insert falhou para {len(errors)} linhas")
+
+                total_loaded += len(batch)
+                self.logger.info(f"Carregados {total_loaded} produtos no BigQuery (streaming)")
+        except Exception as e:
+            self.logger.exception(f"Erro ao carregar no BigQuery: {e}")
+            raise
+
+        if total_loaded == 0:
+            self.logger.info("Nenhum produto para carregar")
+
+        return total_loaded
 
     def _get_table_schema(self):
-        # Schema alinhado ao output do Apify
-        return [
-            bigquery.SchemaField("product_id", "STRING", mode="REQUIRED"),
-            bigquery.SchemaField("title", "STRING", mode="NULLABLE"),
-            bigquery.SchemaField("subtitle", "STRING", mode="NULLABLE"),
-            bigquery.SchemaField("originalPrice", "STRING", mode="NULLABLE"),
-            bigquery.SchemaField("price", "FLOAT", mode="NULLABLE"),
-            bigquery.SchemaField("price_string", "STRING", mode="NULLABLE"),
-            bigquery.SchemaField("alternativePrice", "STRING", mode="NULLABLE"),
-            bigquery.SchemaField("rating", "FLOAT", mode="NULLABLE"),
-            bigquery.SchemaField("reviews", "INT64", mode="NULLABLE"),
-            bigquery.SchemaField("condition", "STRING", mode="NULLABLE"),
-            bigquery.SchemaField("seller", "STRING", mode="NULLABLE"),
-            bigquery.SchemaField("description", "STRING", mode="NULLABLE"),
-            bigquery.SchemaField("images", "STRING", mode="REPEATED"),
-            bigquery.SchemaField("sellCount", "INT64", mode="NULLABLE"),
-            bigquery.SchemaField("url", "STRING", mode="NULLABLE"),
-            bigquery.SchemaField("currency", "STRING", mode="NULLABLE"),
-            bigquery.SchemaField("extraction_date", "TIMESTAMP", mode="REQUIRED"),
-            bigquery.SchemaField("JOB_RUN", "TIMESTAMP", mode="REQUIRED"),
-        ]
\ No newline at end of file
+        return _SCHEMA
\ No newline at end of file
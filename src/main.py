@@ -1,6 +1,13 @@
+import atexit
+import copy
+import functools
+import itertools
 import logging
+import logging.handlers
 import os
+import queue
 import sys
+import threading
 from typing import Dict, Any
 import yaml
 from datetime import datetime
@@ -9,18 +16,44 @@ from dotenv import load_dotenv
 # Load environment variables
 load_dotenv()
 
+# Loader C do PyYAML quando disponível (~5x mais rápido que o puro-Python)
+_YAML_LOADER = getattr(yaml, 'CSafeLoader', yaml.SafeLoader)
+
+
+@functools.lru_cache(maxsize=4)
+def _parse_yaml_cached(config_path: str, mtime_ns: int) -> Dict[str, Any]:
+    """
+    Parse do YAML cacheado por (path, mtime): reinstanciar o pipeline no
+    mesmo processo reutiliza o dict já parseado; mtime invalida em edição.
+    """
+    with open(config_path, 'r', encoding='utf-8') as fh:
+        return yaml.load(fh, Loader=_YAML_LOADER)
+
 from extractors.apify_extractor import ApifyExtractor
 from transformers.product_transformer import ProductTransformer
 from loaders.bigquery_loader import BigQueryLoader
 
-# Logging
+# Logging: o FileHandler é envolvido em um MemoryHandler para gravar em
+# lotes de 1024 registros (erros descarregam na hora) em vez de um flush
+# por linha de log; o atexit garante o último lote no disco
+_file_handler = logging.FileHandler('etl_pipeline.log')
+_memory_handler = logging.handlers.MemoryHandler(
+    capacity=1024,
+    flushLevel=logging.ERROR,
+    target=_file_handler
+)
+atexit.register(_memory_handler.flush)
+
 logging.basicConfig(
     level=os.getenv("LOG_LEVEL", "INFO"),
     format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    handlers=[logging.StreamHandler(sys.stdout), logging.FileHandler('etl_pipeline.log')]
+    handlers=[logging.StreamHandler(sys.stdout), _memory_handler]
 )
 
 class MeliETLPipeline:
+
+    QUEUE_BATCH_SIZE = 500  # Produtos por lote entre os estágios
+
     def __init__(self, config_path: str = 'config/config.yaml'):
         self.logger = logging.getLogger(__name__)
         self.config = self._load_config(config_path)
@@ -33,7 +66,9 @@ class MeliETLPipeline:
             domain_code=self.config.get("apify", {}).get("domain_code", "AR")
         )
 
-        self.transformer = ProductTransformer()
+        self.transformer = ProductTransformer(
+            id_hash_algo=self.config.get("pipeline", {}).get("id_hash_algo", "sha1")
+        )
         self.loader = BigQueryLoader(
             project_id=self.config['bigquery']['project_id'],
             dataset_id=self.config['bigquery']['dataset_id'],
@@ -50,48 +85,99 @@ class MeliETLPipeline:
             "errors": []
         }
 
+        search_query = self.config['apify'].get('search_query', 'Samsung Galaxy S25')
+        self.logger.info("Iniciando execução JOB_RUN=%s - busca: %s", self.job_run_ts, search_query)
+
+        # Estágios sobrepostos: extração e transformação rodam em threads
+        # próprias ligadas por filas limitadas e o load consome no thread
+        # principal, então o tempo total tende a max(estágios) e não à soma
+        raw_queue: queue.Queue = queue.Queue(maxsize=8)
+        transformed_queue: queue.Queue = queue.Queue(maxsize=8)
+        metrics_lock = threading.Lock()
+
+        def extract_worker():
+            try:
+                items = iter(self.extractor.run_search(
+                    search=search_query,
+                    search_category=self.config['apify'].get('search_category', 'all'),
+                    sort_by=self.config['apify'].get('sort_by', 'relevance'),
+                    fast_mode=self.config['apify'].get('fast_mode', False),
+                    use_proxy=self.config['apify'].get('use_proxy', True),
+                ))
+                # islice monta cada lote em C, sem append/resize por item
+                while batch := list(itertools.islice(items, self.QUEUE_BATCH_SIZE)):
+                    with metrics_lock:
+                        metrics['products_extracted'] += len(batch)
+                    raw_queue.put(batch)
+            except Exception as e:
+                self.logger.exception("Erro na extração: %s", e)
+                with metrics_lock:
+                    metrics['errors'].append(str(e))
+            finally:
+                raw_queue.put(None)  # sentinela de EOF
+
+        def transform_worker():
+            try:
+                while True:
+                    batch = raw_queue.get()
+                    if batch is None:
+                        break
+                    transformed = list(self.transformer.transform_products(batch, self.job_run_ts))
+                    with metrics_lock:
+                        metrics['products_transformed'] += len(transformed)
+                    transformed_queue.put(transformed)
+            except Exception as e:
+                self.logger.exception("Erro na transformação: %s", e)
+                with metrics_lock:
+                    metrics['errors'].append(str(e))
+            finally:
+                transformed_queue.put(None)
+
+        def drain(batches: queue.Queue):
+            """Gera os itens dos lotes da fila até o sentinela de EOF."""
+            while True:
+                batch = batches.get()
+                if batch is None:
+                    break
+                yield from batch
+
+        extract_thread = threading.Thread(target=extract_worker, name='extract', daemon=True)
+        transform_thread = threading.Thread(target=transform_worker, name='transform', daemon=True)
+
         try:
-            search_query = self.config['apify'].get('search_query', 'Samsung Galaxy S25')
-            self.logger.info(f"Iniciando execução JOB_RUN={self.job_run_ts} - busca: {search_query}")
-
-            # Extract
-            raw_items = self.extractor.run_search(
-                search=search_query,
-                search_category=self.config['apify'].get('search_category', 'all'),
-                sort_by=self.config['apify'].get('sort_by', 'relevance'),
-                fast_mode=self.config['apify'].get('fast_mode', False),
-                use_proxy=self.config['apify'].get('use_proxy', True),
-            )
-            metrics['products_extracted'] = len(raw_items)
-
-            if not raw_items:
-                self.logger.warning("Nenhum item extraído; finalizando")
-                return metrics
-
-            # Transform
-            transformed = self.transformer.transform_products(raw_items, self.job_run_ts)
-            metrics['products_transformed'] = len(transformed)
-
-            # Load
             self.loader.create_table_if_not_exists()
-            loaded = self.loader.load_data(transformed)
-            metrics['products_loaded'] = loaded
 
-            metrics['success'] = True
-            self.logger.info(f"JOB_RUN {self.job_run_ts} finalizado com sucesso")
+            extract_thread.start()
+            transform_thread.start()
 
+            metrics['products_loaded'] = self.loader.load_data(drain(transformed_queue))
         except Exception as e:
-            self.logger.exception(f"Erro no pipeline: {e}")
+            self.logger.exception("Erro no pipeline: %s", e)
             metrics['errors'].append(str(e))
+        finally:
+            # Com timeout: se o load falhou no meio, os workers podem estar
+            # bloqueados numa fila cheia e não devem segurar o processo.
+            # Se o erro veio antes do start() (ex.: create_table), o ident
+            # ainda é None e o join levantaria RuntimeError
+            for worker in (extract_thread, transform_thread):
+                if worker.ident is not None:
+                    worker.join(timeout=5)
+
+        if metrics['products_extracted'] == 0:
+            self.logger.warning("Nenhum item extraído; finalizando")
+        elif not metrics['errors']:
+            metrics['success'] = True
+            self.logger.info("JOB_RUN %s finalizado com sucesso", self.job_run_ts)
 
         return metrics
 
     def _load_config(self, config_path: str) -> Dict[str, Any]:
         try:
-            with open(config_path, 'r', encoding='utf-8') as fh:
-                cfg = yaml.safe_load(fh)
+            mtime_ns = os.stat(config_path).st_mtime_ns
+            # deepcopy para que mutações abaixo não poluam o dict cacheado
+            cfg = copy.deepcopy(_parse_yaml_cached(config_path, mtime_ns))
         except Exception as e:
-            self.logger.error(f"Erro ao ler config {config_path}: {e}")
+            self.logger.error("Erro ao ler config %s: %s", config_path, e)
             raise
 
         # Defaults minimal